@@ -28,6 +28,7 @@ setup(
                       'sklearn'],
     extras_require={
         'client': ['sticky_pi_api'],
+        'speedups': ['PyTurboJPEG', 'numba', 'lxml'],
         'test': ['nose', 'pytest', 'pytest-cov', 'codecov', 'coverage'],
         'docs': ['mock', 'sphinx-autodoc-typehints', 'sphinx', 'sphinx_rtd_theme', 'recommonmark', 'mock']
     },
@@ -2,6 +2,7 @@ from shapely.geometry import Polygon
 import numpy as np
 import cv2
 import logging
+import copy
 
 
 class Annotation(object):
@@ -41,6 +42,18 @@ class Annotation(object):
         return out
 
 
+    def copy(self, parent_image=None):
+        """
+        A copy of this annotation, with its own contour array.
+        :param parent_image: the image the copy belongs to. ``None`` keeps the current parent
+        """
+        new = copy.copy(self)
+        new._contour = self._contour.copy()
+        new._cached_conv = dict(self._cached_conv)
+        if parent_image is not None:
+            new._parent_image = parent_image
+        return new
+
     def rot_rect_width(self):
         try:
             rect = cv2.minAreaRect(self.contour)
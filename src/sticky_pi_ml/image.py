@@ -1,5 +1,7 @@
 
 import io
+import copy
+import functools
 import json
 import os
 import cv2
@@ -14,18 +16,131 @@ import PIL
 import PIL.Image
 import PIL.ExifTags
 import shutil
-from cairosvg import svg2png
-import svgpathtools
+import threading
 from typing import Union
-import pandas as pd
-import requests
+from concurrent.futures import ThreadPoolExecutor
+# cairosvg, svgpathtools, pandas, requests and numba are imported where they are needed:
+# plain Image/ArrayImage users should not pay for loading them
+
+_SVG_NAMESPACE = 'http://www.w3.org/2000/svg'
+try:
+    from lxml import etree
+    # embedded jpegs are multi-MB attributes, above libxml2's default size limits.
+    # Lifting them is only safe if entities are not expanded and nothing is fetched
+    _SVG_PARSER = etree.XMLParser(huge_tree=True, resolve_entities=False, no_network=True)
+except ImportError:
+    # lxml is optional, svg files are then parsed with the standard library
+    etree = None
 
 from sticky_pi_ml.utils import datetime_to_string, string_to_datetime
 from sticky_pi_ml.annotations import Annotation, DictAnnotation
-from sticky_pi_ml.utils import md5
+from sticky_pi_ml.utils import md5, content_hash, md5_hasher, content_hasher, decode_jpeg, jpeg_shape, HASH_CHUNK_SIZE
+from sticky_pi_ml.utils import EXIF_TRANSPOSED_ORIENTATIONS
+
+
+def _header_shape(fp):
+    # the shape of the decoded array, read from the image header only.
+    # OpenCV applies the EXIF orientation, so we swap the stored dimensions when it rotates by 90 degrees
+    with PIL.Image.open(fp) as img:
+        width, height = img.size
+        orientation = img.getexif().get(0x0112, 1)
+    if orientation in EXIF_TRANSPOSED_ORIENTATIONS:
+        height, width = width, height
+    return height, width, 3
+
+
+def _parse_svg(path):
+    if etree is not None:
+        return etree.parse(path, _SVG_PARSER)
+    return ElementTree.parse(path)
+
+
+def _svg_finder(tag):
+    # a function returning all the svg `tag` elements under a document/element. With lxml, a compiled XPath
+    if etree is not None:
+        return etree.XPath('.//svg:%s' % tag, namespaces={'svg': _SVG_NAMESPACE})
+    path = './/{%s}%s' % (_SVG_NAMESPACE, tag)
+    return lambda node: node.findall(path)
+
+
+_find_svg_images = _svg_finder('image')
+_find_svg_paths = _svg_finder('path')
+_find_svg_groups = _svg_finder('g')
+_find_svg_sticky = _svg_finder('sticky')
+
+
+def _flat_to_int_contour_np(flat, sx, sy):
+    ctr = np.round(np.array([[flat.real / sx, flat.imag / sy]])).astype(int)
+    return ctr.transpose((2, 0, 1))
+
+
+@functools.lru_cache(maxsize=None)
+def _flat_to_int_contour_kernel():
+    try:
+        from numba import njit
+    except ImportError:
+        # numba is optional, contours are then converted with plain numpy
+        return _flat_to_int_contour_np
+
+    @njit(cache=True)
+    def _flat_to_int_contour(flat, sx, sy):
+        # one pass writing straight into the (n, 1, 2) contour, instead of a chain of numpy temporaries
+        out = np.empty((flat.shape[0], 1, 2), dtype=np.int64)
+        for i in range(flat.shape[0]):
+            # round() is round-half-to-even, like np.round
+            out[i, 0, 0] = round(flat[i].real / sx)
+            out[i, 0, 1] = round(flat[i].imag / sy)
+        return out
+    return _flat_to_int_contour
+
+
+# images are typically re-read every epoch. Keyed on the modification time, so edited files are decoded again
+@functools.lru_cache(maxsize=4096)
+def _decode_exif(path, mtime):
+    with PIL.Image.open(path) as img:
+        out = {
+            PIL.ExifTags.TAGS[k]: v
+            for k, v in img._getexif().items()
+            if k in PIL.ExifTags.TAGS
+        }
+        # cast to float for compatibility
+        for k, v in out.items():
+            if isinstance(v, PIL.TiffImagePlugin.IFDRational):
+                out[k] = float(v)
+
+    try:
+        out['Make'] = literal_eval(out['Make'])
+    except ValueError as e:
+        logging.warning('Missing custom metadata in %s, Make is `%s`' % (path, out['Make']))
+    return out
+
+
+# shared by all series (and download threads), so connections are kept alive across populate_from_client calls
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _http_session():
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                                  max_retries=Retry(total=3, backoff_factor=0.2))
+            _SESSION = requests.Session()
+            _SESSION.mount('http://', adapter)
+            _SESSION.mount('https://', adapter)
+    return _SESSION
 
 
 class ImageSeries(list):
+    _n_download_workers = 8
+    # in each cache directory: {filename: [size, mtime_ns, md5, content hash]} of the files
+    # we last validated/downloaded
+    _manifest_filename = '.manifest.json'
+
     def __init__(self, device: str, start_datetime: Union[str, datetime.datetime],
                  end_datetime: Union[str, datetime.datetime]):
         super().__init__()
@@ -71,6 +186,7 @@ class ImageSeries(list):
         client_resp = client.get_images_with_uid_annotations_series([self._info_dict],
                                                                     what_annotation='data',
                                                                     what_image='image')
+        import pandas as pd
         df = pd.DataFrame(client_resp)
         if len(df) == 0:
             logging.warning('No image for %s' % self._info_dict)
@@ -81,8 +197,11 @@ class ImageSeries(list):
             df['algo_version'] = None
             df['algo_name'] = ""
 
-        df = df.sort_values(by=['algo_version', 'datetime'])
-        df = df.drop_duplicates(subset=['id'], keep='last')
+        # sorting by id first puts duplicates next to each other, so keeping the last
+        # (i.e. latest algo version) row of each id is a neighbour comparison, not a hash table pass
+        df = df.sort_values(by=['id', 'algo_version', 'datetime'])
+        ids = df['id'].to_numpy()
+        df = df.iloc[np.r_[ids[:-1] != ids[1:], True]]
         logging.info(f'{len(df)} Images matching')
 
         annotated_images = []
@@ -91,39 +210,174 @@ class ImageSeries(list):
             return annotated_images
 
         logging.info(f'{sum([0 if j is None else 1 for j in df.json])} annotations')
-        for _, r in df.iterrows():
-            r_dict = r.to_dict()
-            if not r_dict['json']:
-                continue
-            if not os.path.isfile(r_dict['url']):
-                if cache_image_dir is None or not os.path.isdir(cache_image_dir):
-                    raise FileNotFoundError(f'The requested image appears to be a remote url: {r["url"]}.'
-                                            f'For this type of resource, a valid cache image directory is needed!')
-
-                filename = os.path.basename(r_dict['url']).split('?')[0]
-                logging.info(f'Downloading {filename}')
-                target = os.path.join(cache_image_dir, filename)
-                if os.path.isfile(target):
-                    local_md5 = md5(target)
-                else:
-                    local_md5 = None
-
-                if r_dict['md5'] != local_md5:
-                    resp = requests.get(r_dict['url']).content
-                    with open(target, 'wb') as file:
-                        file.write(resp)
-
-                local_url = os.path.join(cache_image_dir, filename)
-            else:
-                local_url = r_dict['url']
 
-            im = ImageJsonAnnotations(local_url, json_str=r_dict['json'])
-            annotated_images.append(im)
+        manifest = self._load_manifest(cache_image_dir)
+        session = _http_session()
+        # downloading/hashing is I/O bound and independent across rows, so we overlap it
+        try:
+            with ThreadPoolExecutor(max_workers=self._n_download_workers) as executor:
+                futures = [executor.submit(self._fetch_one, url, json_str, remote_md5,
+                                           cache_image_dir, session, manifest)
+                           for url, json_str, remote_md5 in zip(df['url'].to_numpy(),
+                                                                df['json'].to_numpy(),
+                                                                df['md5'].to_numpy())]
+                annotated_images = [f.result() for f in futures]
+        finally:
+            self._save_manifest(cache_image_dir, manifest)
 
         self.clear()
-        for im in sorted(annotated_images, key=lambda x: x.datetime):
+        for im in sorted([im for im in annotated_images if im is not None], key=lambda x: x.datetime):
             self.append(im)
 
+    def _fetch_one(self, url, json_str, remote_md5, cache_image_dir, session, manifest):
+        if not json_str:
+            return None
+        if not os.path.isfile(url):
+            if cache_image_dir is None or not os.path.isdir(cache_image_dir):
+                raise FileNotFoundError(f'The requested image appears to be a remote url: {url}.'
+                                        f'For this type of resource, a valid cache image directory is needed!')
+
+            filename = os.path.basename(url).split('?')[0]
+            logging.info(f'Downloading {filename}')
+            target = os.path.join(cache_image_dir, filename)
+            local_hash = self._cached_content_hash(target, remote_md5, manifest.get(filename))
+            if local_hash is None:
+                local_hash = self._download(url, target, remote_md5, session)
+            stat = os.stat(target)
+            manifest[filename] = [stat.st_size, stat.st_mtime_ns, remote_md5, local_hash]
+
+            local_url = target
+        else:
+            local_url = url
+
+        return ImageJsonAnnotations(local_url, json_str=json_str)
+
+    def _download(self, url, target, remote_md5, session, retry=True):
+        # returns the content hash of the downloaded file.
+        # We stream to a `.part` file that is only renamed to `target` once complete,
+        # so an interrupted transfer can be resumed with a range request on the next sync
+        part = target + '.part'
+        # the ETag/Last-Modified of the partial body. Sent as `If-Range`, so we only get the missing tail
+        # if the remote object did not change in the meantime (otherwise the server sends the whole body)
+        validator_file = part + '.validator'
+        hash_md5, hash_local = md5_hasher(), content_hasher()
+
+        headers = {}
+        if os.path.isfile(part) and os.path.isfile(validator_file):
+            with open(validator_file, 'r') as f:
+                validator = f.read().strip()
+            if validator:
+                headers = {'Range': 'bytes=%i-' % os.path.getsize(part), 'If-Range': validator}
+
+        with session.get(url, headers=headers, stream=True, timeout=30) as resp:
+            if resp.status_code == 416 and headers:
+                # the range is not satisfiable. Typically, the part is already complete (we were interrupted
+                # before renaming it), in which case we just promote it. Otherwise, we start over
+                os.remove(validator_file)
+                part_md5, part_hash = self._md5_and_content_hash(part)
+                if part_md5 == remote_md5:
+                    os.replace(part, target)
+                    return part_hash
+                os.remove(part)
+                return self._download(url, target, remote_md5, session, retry)
+            resp.raise_for_status()
+
+            if resp.status_code == 206:
+                mode = 'ab'
+                # the prefix we already have is part of the digests
+                with open(part, 'rb') as file:
+                    while chunk := file.read(HASH_CHUNK_SIZE):
+                        hash_md5.update(chunk)
+                        hash_local.update(chunk)
+            else:
+                mode = 'wb'
+                validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+                if validator:
+                    with open(validator_file, 'w') as f:
+                        f.write(validator)
+                elif os.path.isfile(validator_file):
+                    os.remove(validator_file)
+
+            with open(part, mode) as file:
+                for chunk in resp.iter_content(HASH_CHUNK_SIZE):
+                    file.write(chunk)
+                    hash_md5.update(chunk)
+                    hash_local.update(chunk)
+
+        if os.path.isfile(validator_file):
+            os.remove(validator_file)
+
+        if hash_md5.hexdigest() != remote_md5:
+            os.remove(part)
+            if retry:
+                logging.warning(f'md5 of downloaded {target} does not match the remote md5. Downloading again')
+                return self._download(url, target, remote_md5, session, retry=False)
+            raise Exception(f'md5 of downloaded {target} does not match the remote md5 ({remote_md5})')
+
+        os.replace(part, target)
+        return hash_local.hexdigest()
+
+    def _cached_content_hash(self, target, remote_md5, manifest_entry=None):
+        """
+        Check whether a cached file is a copy of the remote image.
+        If the file has the size and mtime recorded in the manifest, we trust the recorded md5 and read nothing.
+        Otherwise, if the recorded md5 is the remote one, we compare the (faster) recorded content hash.
+        The md5 (the API format) is only computed when the manifest has no usable entry for the file.
+
+        :return: the content hash of the cached file, or ``None`` if it is missing or outdated
+        """
+        if not os.path.isfile(target):
+            return None
+        try:
+            size, mtime_ns, recorded_md5, recorded_hash = manifest_entry
+        except (TypeError, ValueError):
+            # no entry, or a malformed/older one: as if the file was not in the manifest
+            pass
+        else:
+            stat = os.stat(target)
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                return recorded_hash if recorded_md5 == remote_md5 else None
+            if recorded_md5 == remote_md5:
+                local_hash = content_hash(target)
+                return local_hash if local_hash == recorded_hash else None
+
+        local_md5, local_hash = self._md5_and_content_hash(target)
+        return local_hash if local_md5 == remote_md5 else None
+
+    @staticmethod
+    def _md5_and_content_hash(path):
+        # both digests, in a single read of the file
+        hash_md5, hash_local = md5_hasher(), content_hasher()
+        with open(path, 'rb') as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                hash_md5.update(chunk)
+                hash_local.update(chunk)
+        return hash_md5.hexdigest(), hash_local.hexdigest()
+
+    def _load_manifest(self, cache_image_dir):
+        if cache_image_dir is None:
+            return {}
+        try:
+            with open(os.path.join(cache_image_dir, self._manifest_filename), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, cache_image_dir, manifest):
+        if cache_image_dir is None or not manifest or not os.path.isdir(cache_image_dir):
+            return
+        # other processes may have synced other series in the same directory meanwhile
+        merged = self._load_manifest(cache_image_dir)
+        merged.update(manifest)
+        fd, tmp = tempfile.mkstemp(dir=cache_image_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp, os.path.join(cache_image_dir, self._manifest_filename))
+        except Exception as e:
+            os.remove(tmp)
+            raise e
+
 
 class Image(object):
     def __init__(self, path: str):
@@ -217,9 +471,13 @@ class Image(object):
     @property
     def shape(self):
         if self._shape is None:
-            self.read()
+            self._shape = self._read_shape()
         return self._shape
 
+    def _read_shape(self):
+        # the dimensions are in the image header, no need to decode the pixels
+        return _header_shape(self._path)
+
     @property
     def device(self):
         return self._device
@@ -259,7 +517,8 @@ class Image(object):
         return im
 
     def _get_array(self):
-        out = cv2.imread(self._path)
+        with open(self._path, 'rb') as f:
+            out = decode_jpeg(f.read())
         if out is None:
             raise Exception('Could not read image file %s' % self._path)
         return out
@@ -271,60 +530,41 @@ class Image(object):
         return self._metadata
 
     def _decode_metadata(self):
-        with PIL.Image.open(self._path) as img:
-            out = {
-                PIL.ExifTags.TAGS[k]: v
-                for k, v in img._getexif().items()
-                if k in PIL.ExifTags.TAGS
-            }
-            # cast to float for compatibility
-            for k, v in out.items():
-                if isinstance(v, PIL.TiffImagePlugin.IFDRational):
-                    out[k] = float(v)
-
-        try:
-            out['Make'] = literal_eval(out['Make'])
-        except ValueError as e:
-            logging.warning('Missing custom metadata in %s, Make is `%s`' % (self._path, out['Make']))
-        return out
+        # copied, as callers update their metadata in place
+        return copy.deepcopy(_decode_exif(self._path, os.path.getmtime(self._path)))
 
     def _img_buffer(self):
         with open(self._path, "rb") as image_file:
             encoded_string = base64.b64encode(image_file.read())
         return encoded_string
 
-    def to_svg(self, target, embed_jpeg=True, include_metadata=True):
+    def _svg_bytes(self, embed_jpeg=True, include_metadata=True):
+        height, width = self.shape[0:2]
+        if include_metadata:
+            desc = 'desc="' + str(self.metadata) + '"'
+        else:
+            desc = ''
+
+        # the document is assembled in memory and joined at once. The base64 jpeg stays as bytes
+        parts = [('<svg width="%i" height="%i"'
+                  ' xmlns:xlink="http://www.w3.org/1999/xlink"'
+                  ' xmlns="http://www.w3.org/2000/svg"'
+                  ' >' % (width, height)).encode()]
+        if embed_jpeg:
+            parts.append(('<image %s width="%i" height="%i" x="0" y="0" xlink:href="data:image/jpeg;base64,' % (
+                desc, width, height)).encode())
+            parts.append(self._img_buffer())
+            parts.append(b'"/>')
+        parts.append(''.join(a.svg_element() for a in self._annotations).encode())
+        parts.append(b'</svg>')
+        return b''.join(parts)
 
-        # tmp_img = tempfile.mktemp(suffix='.jpg')
+    def to_svg(self, target, embed_jpeg=True, include_metadata=True):
+        svg = self._svg_bytes(embed_jpeg, include_metadata)
         tmp_svg = tempfile.mktemp(suffix='.svg')
-
         try:
-            height, width = self.read().shape[0:2]
-            if include_metadata:
-                meta = self.metadata
-                desc = 'desc="' + str(self.metadata) + '"'
-
-            else:
-                desc = ''
-
-            encoded_string = self._img_buffer()
-
-            with open(tmp_svg, 'w+') as f:
-                f.write('<svg width="' + str(width) + '"' +
-                        ' height="' + str(height) + '"' +
-                        ' xmlns:xlink="http://www.w3.org/1999/xlink"' +
-                        ' xmlns="http://www.w3.org/2000/svg"' +
-                        ' >')
-                #     f.write('<metadata  id="sticky_pi"> "%s" </metadata>' % str(self.metadata()))
-                if embed_jpeg:
-                    f.write('<image %s width="%i" height="%i" x="0" y="0" xlink:href="data:image/jpeg;base64,%s"/>' % (
-                        desc,
-                        width, height, str(encoded_string, 'utf-8')))
-
-                for a in self._annotations:
-                    f.write(a.svg_element())
-                f.write('</svg>')
-
+            with open(tmp_svg, 'wb') as f:
+                f.write(svg)
             shutil.move(tmp_svg, target)
 
         except Exception as e:
@@ -332,27 +572,34 @@ class Image(object):
             raise e
 
     def to_png(self, target, show_datetime=False, scale=1):
-        tmp_png = tempfile.mktemp(suffix='.png')
-        tmp_svg = tempfile.mktemp(suffix='.svg')
-
-        try:
-            self.to_svg(tmp_svg, embed_jpeg=False, include_metadata=False)
-            with open(tmp_svg, 'r') as f:
-                svg2png(file_obj=f, write_to=tmp_png, scale=scale)
-
-            png = PIL.Image.open(tmp_png)
+        # the annotation layer is rendered and composited in memory, no temporary files
+        from cairosvg import svg2png
+        png_buffer = io.BytesIO()
+        svg2png(bytestring=self._svg_bytes(embed_jpeg=False, include_metadata=False),
+                write_to=png_buffer, scale=scale)
+        png_buffer.seek(0)
+
+        with PIL.Image.open(png_buffer) as png:
             bg = cv2.resize(self.read(), png.size)
-
             background = PIL.Image.fromarray(cv2.cvtColor(bg, cv2.COLOR_BGR2BGRA))
-
             alpha_composite = PIL.Image.alpha_composite(background, png)
-            alpha_composite.save(tmp_png, 'PNG')
-            shutil.move(tmp_png, target)
-        finally:
-            os.remove(tmp_svg)
+        alpha_composite.save(target, 'PNG')
 
     def copy(self):
-        import copy
+        """
+        A copy of this image, with its own annotations and metadata.
+        Cached pixels, if any, are shared rather than duplicated, so treat them as read-only.
+        Use :meth:`deep_copy` to clone them too.
+        """
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new._metadata = copy.deepcopy(self._metadata)
+        # annotations that belonged to this image now belong to the copy, the others keep their parent
+        new._annotations = [a.copy(parent_image=new if a.parent_image is self else None)
+                            for a in self._annotations]
+        return new
+
+    def deep_copy(self):
         return copy.deepcopy(self)
 
     def set_annotations(self, annotations):
@@ -373,30 +620,36 @@ class SVGImage(Image):
         # the shape of the image within the svg document
         # will have to scale the contours  to match the actual dimensions of the embedded image
         self._scale_in_svg = None
-        self._parse_metadata()
-        self._parse_annotations()
+        # parsed once, shared by metadata and annotation parsing. Not kept: the tree holds the base64 jpeg
+        doc = _parse_svg(self._path)
+        ims = _find_svg_images(doc)
+        if len(ims) != 1:
+            raise Exception("Cannot extract image from %s" % self._path)
+        # the embedded jpeg, base64-decoded once and reused for reading, hashing and extracting
+        self._jpeg_bytes = self._jpeg_bytes_id(ims, 0)
+        self._parse_metadata(doc, ims)
+        self._parse_annotations(doc)
 
     def _parse(self, file):
 
         self.update(self._device_datetime_info(self._filename))
-        self['md5'] = md5(self.extract_jpeg(as_buffer=True))
+        self['md5'] = md5(io.BytesIO(self._jpeg_bytes))
 
     def _img_buffer(self):
-        encoded_string = base64.b64encode(self.extract_jpeg(as_buffer=True).read())
+        encoded_string = base64.b64encode(self._jpeg_bytes)
         return encoded_string
 
     def _style_to_dic(self, p):
-        style = p.attrib['style'].split(';')
-        d = {}
-        for s in style:
-            k, v = s.split(':')
-            d[k] = v
-        return d
-
-    def _parse_annotations(self):
-        doc = ElementTree.parse(self._path)
+        # e.g. "stroke:#ff0000;fill-opacity:0.2". str.split is faster than a regex for these short strings
+        style = p.attrib['style']
+        try:
+            return dict(d.split(':', 1) for d in style.strip().rstrip(';').split(';'))
+        except ValueError:
+            raise ValueError('Malformed style declaration in `%s`' % style)
+
+    def _parse_annotations(self, doc):
         self._annotations = []
-        paths = doc.findall('.//{http://www.w3.org/2000/svg}path')
+        paths = _find_svg_paths(doc)
         for p in paths:
             style = self._style_to_dic(p)
             contours = self._svg_path_to_contour(p)
@@ -405,13 +658,7 @@ class SVGImage(Image):
                     a = Annotation(c, style['stroke'], parent_image=self)
                     self._annotations.append(a)
 
-    def _parse_metadata(self):
-        doc = ElementTree.parse(self._path)
-
-        ims = doc.findall('.//{http://www.w3.org/2000/svg}image')
-        if len(ims) != 1:
-            raise Exception("Cannot extract image from %s" % self._path)
-
+    def _parse_metadata(self, doc, ims):
         attrs = ims[0].attrib
         if 'w' in attrs:
             im_w = ims[0].attrib['w']
@@ -428,7 +675,7 @@ class SVGImage(Image):
             raise Exception('Embedded image %s does not have height' % self._path)
 
         svg_im_shape = (int(im_h), int(im_w))
-        jpg_im_shape = self._get_array().shape
+        jpg_im_shape = self.shape
         self._scale_in_svg = np.array(svg_im_shape) / np.array(jpg_im_shape[0:2])
 
         try:
@@ -438,7 +685,7 @@ class SVGImage(Image):
         except KeyError:
             logging.warning('Cannot find a desc attribute in image. Maybe a legacy SVG')
             try:
-                sticky_data = doc.findall('.//{http://www.w3.org/2000/svg}sticky')
+                sticky_data = _find_svg_sticky(doc)
                 if len(sticky_data) != 1:
                     raise KeyError('One and only one sticky metadata field should exist in svg image')
                 str = sticky_data[0].attrib['metadata']
@@ -458,6 +705,7 @@ class SVGImage(Image):
             logging.warning('Missing custom metadata in %s, Make is `%s`' % (self._path, self._metadata['Make']))
 
     def _svg_path_to_contour(self, p, n_point_per_segment=2):
+        import svgpathtools
         string = p.attrib['d']
         tvals = np.linspace(0, 1, n_point_per_segment)
         try:
@@ -476,7 +724,15 @@ class SVGImage(Image):
 
         out = []
         for sp in sub_paths:
-            arr = np.array([s.poly()(tvals) for s in sp])
+            # evaluate all segments at once, as one (n_segments, degree + 1) @ (degree + 1, n_points) product
+            polys = [s.poly().coeffs for s in sp]
+            n_coeffs = max(len(c) for c in polys)
+            coeffs = np.zeros((len(sp), n_coeffs), dtype=np.complex128)
+            for i, c in enumerate(polys):
+                # coefficients are highest degree first, so lower degree segments are right-aligned
+                coeffs[i, n_coeffs - len(c):] = c
+            powers = tvals[:, None] ** np.arange(n_coeffs - 1, -1, -1)
+            arr = coeffs @ powers.T
             starts = arr[0:len(sp) - 1, n_point_per_segment - 1]
             ends = arr[1:len(sp), 0]
 
@@ -487,9 +743,7 @@ class SVGImage(Image):
             if sum_magnitude > 1e-3:
                 raise Exception('SVG path interrupted %s' % str(path))
             flat = arr[:, 0:n_point_per_segment - 1].flatten()
-            ctr = np.round(np.array([[flat.real / self._scale_in_svg[0], flat.imag / self._scale_in_svg[1]]])).astype(
-                int)
-            ctr = ctr.transpose((2, 0, 1))
+            ctr = _flat_to_int_contour_kernel()(flat, self._scale_in_svg[0], self._scale_in_svg[1])
             # ignore contours that do not have 3 points
             if ctr.shape[0] > 2:
                 out.append(ctr)
@@ -501,30 +755,34 @@ class SVGImage(Image):
         return self._metadata
 
     def _get_array(self):
-        buffer = self.extract_jpeg(as_buffer=True)
-        bytes_as_np_array = np.frombuffer(buffer.read(), dtype=np.uint8)
-        img = cv2.imdecode(bytes_as_np_array, cv2.IMREAD_COLOR)
-        return img
+        return decode_jpeg(self._jpeg_bytes)
+
+    def _read_shape(self):
+        shape = jpeg_shape(self._jpeg_bytes)
+        if shape is not None:
+            return shape
+        # not a (well formed) jpeg, let PIL work it out
+        return _header_shape(io.BytesIO(self._jpeg_bytes))
 
     def extract_jpeg(self, target=None, as_buffer=False):
-        doc = ElementTree.parse(self._path)
-        ims = doc.findall('.//{http://www.w3.org/2000/svg}image')
-        if len(ims) != 1:
-            raise Exception("Cannot extract image from %s" % target)
-        return self._extract_jpeg_id(ims, 0, target, as_buffer)
+        return self._write_jpeg_bytes(self._jpeg_bytes, target, as_buffer)
 
     def _extract_jpeg_id(self, ims, id=0, target=None, as_buffer=False):
+        return self._write_jpeg_bytes(self._jpeg_bytes_id(ims, id), target, as_buffer)
+
+    @staticmethod
+    def _jpeg_bytes_id(ims, id=0):
         utf_str = ims[id].attrib['{http://www.w3.org/1999/xlink}href'].split(',')[1]
         utf_str = utf_str.strip('\"\'')
+        return base64.b64decode(utf_str)
 
+    @staticmethod
+    def _write_jpeg_bytes(jpeg_bytes, target=None, as_buffer=False):
         if as_buffer:
-            buffer = io.BytesIO()
-            buffer.write(base64.b64decode(utf_str))
-            buffer.seek(0)
-            return buffer
+            return io.BytesIO(jpeg_bytes)
 
         with open(target, 'wb') as f:
-            f.write(base64.b64decode(utf_str))
+            f.write(jpeg_bytes)
 
 
 class ArrayImage(Image):
@@ -547,6 +805,9 @@ class ArrayImage(Image):
         self._shape = self._array.shape
         return self._array
 
+    def _read_shape(self):
+        return self._array.shape
+
 
 class BufferImage(Image):
     def __init__(self, buffer, device, datetime):
@@ -569,14 +830,21 @@ class BufferImage(Image):
         if self._array is not None:
             return self._array
         self._buffer.seek(0)
-        bytes_as_np_array = np.frombuffer(self._buffer.read(), dtype=np.uint8)
-        array = cv2.imdecode(bytes_as_np_array, cv2.IMREAD_COLOR)
+        array = decode_jpeg(self._buffer.read())
 
         if cache:
             self._array = array
         self._shape = array.shape
         return array
 
+    def _read_shape(self):
+        if self._array is not None:
+            return self._array.shape
+        self._buffer.seek(0)
+        shape = _header_shape(self._buffer)
+        self._buffer.seek(0)
+        return shape
+
 
 class ImageJsonAnnotations(Image):
     def __init__(self, path, json_str=None, json_path=None):
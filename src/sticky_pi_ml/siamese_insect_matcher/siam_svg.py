@@ -3,13 +3,12 @@ import datetime
 import cv2
 import numpy as np
 import io
-from xml.etree import ElementTree
 from sticky_pi_ml.image import SVGImage, BufferImage, Image
+from sticky_pi_ml.image import _parse_svg, _find_svg_images, _find_svg_groups, _find_svg_paths
 from sticky_pi_ml.annotations import Annotation
-from sticky_pi_ml.utils import iou, iou_match_pairs
+from sticky_pi_ml.utils import iou, iou_match_pairs, decode_jpeg
 from shapely.geometry import Polygon
 import tempfile
-import base64
 import os
 import shutil
 
@@ -34,8 +33,11 @@ class SiamSVG(SVGImage):
         self._im1 = None
         self._annotation_pairs = []
         self._path = path
-        self._get_images()
-        self._parse_annots()
+        # the decoded jpegs of the top and bottom images. The elements are not kept: they hold the base64 data
+        self._jpeg_bytes_pair = None
+        doc = _parse_svg(self._path)
+        self._get_images(_find_svg_images(doc))
+        self._parse_annots(doc)
 
     def __repr__(self):
         return os.path.basename(self._path)
@@ -61,8 +63,8 @@ class SiamSVG(SVGImage):
         tmp_svg = tempfile.mktemp(suffix='.svg')
 
         try:
-            height, width = im0.read().shape[0:2]
-            height2, width2 = im1.read().shape[0:2]
+            height, width = im0.shape[0:2]
+            height2, width2 = im1.shape[0:2]
 
             assert height == height2 and width == width2
 
@@ -157,11 +159,10 @@ class SiamSVG(SVGImage):
     def annotation_pairs(self):
         return self._annotation_pairs
 
-    def _parse_annots(self):
-        doc = ElementTree.parse(self._path)
-        groups = doc.findall('.//{http://www.w3.org/2000/svg}g')
+    def _parse_annots(self, doc):
+        groups = _find_svg_groups(doc)
         for g in groups:
-            p = g.findall('.//{http://www.w3.org/2000/svg}path')
+            p = _find_svg_paths(g)
             if len(p) != 2:
                 raise Exception("Not two paths in group %s in file %s" % (g.attrib['id'], self._path))
 
@@ -190,11 +191,7 @@ class SiamSVG(SVGImage):
         assert len(all_annotations) == 1
         return all_annotations[0]
 
-    def _get_images(self):
-
-        doc = ElementTree.parse(self._path)
-        ims = doc.findall('.//{http://www.w3.org/2000/svg}image')
-
+    def _get_images(self, ims):
         if len(ims) != 2:
             raise Exception("Cannot extract images from %s" % self._path)
 
@@ -230,30 +227,19 @@ class SiamSVG(SVGImage):
         dt0 = datetime.datetime.strptime(dtstr0, '%Y-%m-%d_%H-%M-%S')
         dt1 = datetime.datetime.strptime(dtstr1, '%Y-%m-%d_%H-%M-%S')
 
-        self._im0 = BufferImage(b0, device=device, datetime=dt0)
-        self._im1 = BufferImage(b1, device=device, datetime=dt1)
+        self._jpeg_bytes_pair = (b0, b1)
+        # a BytesIO made from bytes shares them until written to
+        self._im0 = BufferImage(io.BytesIO(b0), device=device, datetime=dt0)
+        self._im1 = BufferImage(io.BytesIO(b1), device=device, datetime=dt1)
 
         self._device = device
         self._metadata = None
 
     def extract_jpeg(self, target=None, as_buffer=False, id=0):
-        doc = ElementTree.parse(self._path)
-        ims = doc.findall('.//{http://www.w3.org/2000/svg}image')
-        if len(ims) != 2:
-            raise Exception("Unexpected number of images in %s" % self._path)
-        return self._extract_jpeg_id(ims, id, target, as_buffer)
-
-    def _get_buffer(self, im):
-        utf_str = im.attrib['{http://www.w3.org/1999/xlink}href'].split(',')[1]
-        utf_str = utf_str.strip('\"\'')
-
-        buffer = io.BytesIO()
-        buffer.write(base64.b64decode(utf_str))
-        buffer.seek(0)
-        return buffer
+        # id 0 is the top image, 1 the bottom one
+        return self._write_jpeg_bytes(self._jpeg_bytes_pair[id], target, as_buffer)
 
     def _get_one_image(self, im):
-        buffer = self._get_buffer(im)
-        bytes_as_np_array = np.frombuffer(buffer.read(), dtype=np.uint8)
-        img = cv2.imdecode(bytes_as_np_array, cv2.IMREAD_COLOR)
-        return img, buffer
+        jpeg_bytes = self._jpeg_bytes_id([im])
+        img = decode_jpeg(jpeg_bytes)
+        return img, jpeg_bytes
@@ -9,6 +9,7 @@ import tempfile
 from sticky_pi_ml.annotations import Annotation
 import glob
 import shutil
+import hashlib
 
 test_dir = os.path.dirname(__file__)
 
@@ -88,6 +89,121 @@ class TestImage(unittest.TestCase):
     def test_to_svg(self):
         self._to_svg(self._test_image)
 
+    def test_copy(self):
+        im = Image(self._test_image)
+        array = im.read(cache=True)
+        contour = np.array([[[551, 552], [883, 884], [995, 596]]]).transpose((1, 0, 2))
+        im.set_annotations([Annotation(contour, '#ffff00', parent_image=im),
+                            Annotation(contour.copy(), '#ffff00')])
+        im.tag_detector_version('detector', '1000-abc')
+
+        # as the predictor uses it
+        new = im.copy()
+        new.set_annotations([Annotation(contour + 10, '#0000ff', parent_image=im)])
+        new.tag_detector_version('detector', '2000-def')
+        self.assertEqual(im.algo_version, '1000-abc')
+        self.assertEqual(new.algo_version, '2000-def')
+        self.assertEqual(len(im.annotations), 2)
+        np.testing.assert_array_equal(im.annotations[0].contour, contour)
+
+        new = im.copy()
+        # annotations are copied, and only re-parented if they were attached to the original
+        self.assertIsNot(new.annotations[0], im.annotations[0])
+        self.assertIs(new.annotations[0].parent_image, new)
+        self.assertIsNone(new.annotations[1].parent_image)
+        new.annotations[0].contour[0, 0, 0] = 0
+        np.testing.assert_array_equal(im.annotations[0].contour, contour)
+        # cached pixels are shared by a copy, cloned by a deep copy
+        self.assertIs(new.read(), array)
+        deep = im.deep_copy()
+        self.assertIsNot(deep.read(), array)
+        np.testing.assert_array_equal(deep.read(), array)
+        self.assertIs(deep.annotations[0].parent_image, deep)
+
+    def test_style_to_dic(self):
+        from xml.etree import ElementTree
+        im = SVGImage.__new__(SVGImage)
+
+        def parse(style):
+            return im._style_to_dic(ElementTree.Element('path', style=style))
+
+        self.assertEqual(parse('stroke:#0000ff;stroke-opacity:1;fill:#ff0000;fill-opacity:0.200000'),
+                         {'stroke': '#0000ff', 'stroke-opacity': '1', 'fill': '#ff0000', 'fill-opacity': '0.200000'})
+        # a trailing `;` is accepted, and values may contain `:`
+        self.assertEqual(parse('stroke:#ff0000;fill:none;'), {'stroke': '#ff0000', 'fill': 'none'})
+        self.assertEqual(parse('font-family:a:b'), {'font-family': 'a:b'})
+        # an empty value is kept, not silently dropped
+        self.assertEqual(parse('stroke:;fill:#0'), {'stroke': '', 'fill': '#0'})
+        # declarations without a `:` are errors
+        for style in ['', 'stroke', 'stroke:#ff0000;;fill:none', 'stroke:#ff0000;fill']:
+            with self.assertRaises(ValueError):
+                parse(style)
+
+    def test_rotated_jpeg(self):
+        from sticky_pi_ml.tests.test_utils import rotated_jpeg_bytes
+        tmp_dir = tempfile.mkdtemp(prefix='sticky_pi_test_')
+        try:
+            # orientation 6: stored landscape, decoded (by OpenCV) portrait
+            path = os.path.join(tmp_dir, '1b74105a.2020-07-05_10-07-16.jpg')
+            with open(path, 'wb') as f:
+                f.write(rotated_jpeg_bytes(6))
+            rotated_shape = (self._image_shape[1], self._image_shape[0], 3)
+
+            im = Image(path)
+            # the header-only shape is the shape of the pixels
+            self.assertEqual(im.shape, rotated_shape)
+            self.assertEqual(im.read().shape, rotated_shape)
+            self.assertEqual(im.shape, rotated_shape)
+
+            contours = [np.array([[[551, 552], [883, 884], [995, 596]]]).transpose((1, 0, 2))]
+            im.set_annotations([Annotation(c, '#ffff00') for c in contours])
+            target = os.path.join(tmp_dir, '1b74105a.2020-07-05_10-07-16.svg')
+            im.to_svg(target, include_metadata=False)
+            imsvg = SVGImage(target)
+            self.assertEqual(imsvg.shape, rotated_shape)
+            self.assertEqual(imsvg.read().shape, rotated_shape)
+            # the svg is as large as the decoded image, so contours are not rescaled
+            np.testing.assert_array_equal(imsvg._scale_in_svg, [1, 1])
+            np.testing.assert_array_equal(imsvg.annotations[0].contour, contours[0])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_svg_path_to_contour(self):
+        import svgpathtools
+        from xml.etree import ElementTree
+        # lines, quadratic and cubic beziers, a zero-length line (whose poly1d drops its leading zero)
+        # and a second sub-path
+        d = ('M 10 10 L 110 10 Q 160 60 110 110 C 90 130 30 130 10 110 L 10 110 L 10 10 Z '
+             'M 200 200 L 300 200 L 300 300 Z')
+        p = ElementTree.Element('path', d=d)
+
+        svg_im = SVGImage.__new__(SVGImage)
+        svg_im._path = 'test.svg'
+        svg_im._scale_in_svg = np.array([0.5, 2.0])
+        contours = svg_im._svg_path_to_contour(p)
+
+        # reference: one poly1d evaluation per segment
+        tvals = np.linspace(0, 1, 2)
+        sub_paths = []
+        last_end = None
+        for seg in svgpathtools.parse_path(d):
+            if seg.start != last_end:
+                sub_paths.append(svgpathtools.Path())
+            sub_paths[-1].append(seg)
+            last_end = seg.end
+        self.assertTrue(any(len(s.poly().coeffs) == 1 for sp in sub_paths for s in sp))
+
+        expected = []
+        for sp in sub_paths:
+            arr = np.array([s.poly()(tvals) for s in sp])
+            flat = arr[:, 0].flatten()
+            ctr = np.round(np.array([[flat.real / 0.5, flat.imag / 2.0]])).astype(int)
+            expected.append(ctr.transpose((2, 0, 1)))
+
+        self.assertEqual(len(contours), len(expected))
+        for c, e in zip(contours, expected):
+            np.testing.assert_array_equal(c, e)
+
 
     # def test_json_image(self):
     #     im = self._test_svg_images[2]
@@ -231,3 +347,185 @@ class TestImage(unittest.TestCase):
         # finally:
         #     shutil.rmtree(tmp_dir)
         #     pass
+
+
+class _FakeResponse(object):
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception('HTTP error %i' % self.status_code)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self._body), chunk_size):
+            yield self._body[i: i + chunk_size]
+
+
+class _ScriptedSession(object):
+    # replies to successive `get` with the given responses, and records the headers it was sent
+    def __init__(self, responses):
+        self._responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.sent_headers.append(headers or {})
+        return self._responses.pop(0)
+
+
+class TestImageSeriesDownload(unittest.TestCase):
+    _body = b'0123456789' * 1000
+    _md5 = hashlib.md5(_body).hexdigest()
+    _hash = hashlib.blake2b(_body, digest_size=16).hexdigest()
+    _url = 'https://example.com/0a5bb6f4.2020-06-20_20-19-15.jpg'
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp(prefix='sticky_pi_test_')
+        self._target = os.path.join(self._tmp_dir, '0a5bb6f4.2020-06-20_20-19-15.jpg')
+        self._part = self._target + '.part'
+        self._validator = self._part + '.validator'
+        self._series = ImageSeries(device='0a5bb6f4',
+                                   start_datetime='2020-01-01_00-00-00',
+                                   end_datetime='2021-01-01_00-00-00')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _make_part(self, content, validator='"etag-1"'):
+        with open(self._part, 'wb') as f:
+            f.write(content)
+        with open(self._validator, 'w') as f:
+            f.write(validator)
+
+    def _assert_downloaded(self, local_hash):
+        # `_download` returns the content hash, to be recorded in the manifest
+        self.assertEqual(local_hash, self._hash)
+        with open(self._target, 'rb') as f:
+            self.assertEqual(f.read(), self._body)
+        self.assertFalse(os.path.exists(self._part))
+        self.assertFalse(os.path.exists(self._validator))
+
+    def test_full_download(self):
+        session = _ScriptedSession([_FakeResponse(200, self._body, {'ETag': '"etag-1"'})])
+        local_hash = self._series._download(self._url, self._target, self._md5, session)
+        self.assertEqual(session.sent_headers, [{}])
+        self._assert_downloaded(local_hash)
+
+    def test_resume_partial(self):
+        self._make_part(self._body[:1234])
+        session = _ScriptedSession([_FakeResponse(206, self._body[1234:])])
+        local_hash = self._series._download(self._url, self._target, self._md5, session)
+        self.assertEqual(session.sent_headers, [{'Range': 'bytes=1234-', 'If-Range': '"etag-1"'}])
+        # the prefix we already had is part of the md5, so the check passes
+        self._assert_downloaded(local_hash)
+
+    def test_changed_remote_restarts(self):
+        # the remote object changed: the server ignores the range and sends the whole body
+        self._make_part(b'stale prefix')
+        session = _ScriptedSession([_FakeResponse(200, self._body, {'ETag': '"etag-2"'})])
+        local_hash = self._series._download(self._url, self._target, self._md5, session)
+        self.assertIn('Range', session.sent_headers[0])
+        self._assert_downloaded(local_hash)
+
+    def test_unsatisfiable_range_complete_part(self):
+        # interrupted after the download, but before the rename: no need to fetch anything again
+        self._make_part(self._body)
+        session = _ScriptedSession([_FakeResponse(416)])
+        local_hash = self._series._download(self._url, self._target, self._md5, session)
+        self.assertEqual(len(session.sent_headers), 1)
+        self._assert_downloaded(local_hash)
+
+    def test_unsatisfiable_range_restarts(self):
+        self._make_part(self._body + b'garbage')
+        session = _ScriptedSession([_FakeResponse(416), _FakeResponse(200, self._body)])
+        local_hash = self._series._download(self._url, self._target, self._md5, session)
+        self.assertEqual(session.sent_headers[1], {})
+        self._assert_downloaded(local_hash)
+
+    def test_md5_mismatch_retries_once(self):
+        session = _ScriptedSession([_FakeResponse(200, b'corrupted'), _FakeResponse(200, self._body)])
+        local_hash = self._series._download(self._url, self._target, self._md5, session)
+        self.assertEqual(len(session.sent_headers), 2)
+        self._assert_downloaded(local_hash)
+
+    def test_md5_mismatch_raises(self):
+        session = _ScriptedSession([_FakeResponse(200, b'corrupted'), _FakeResponse(200, b'corrupted')])
+        with self.assertRaises(Exception):
+            self._series._download(self._url, self._target, self._md5, session)
+        self.assertEqual(len(session.sent_headers), 2)
+        self.assertFalse(os.path.exists(self._target))
+        self.assertFalse(os.path.exists(self._part))
+
+
+class TestImageSeriesCache(unittest.TestCase):
+    _body = b'0123456789' * 1000
+    _md5 = hashlib.md5(_body).hexdigest()
+    _hash = hashlib.blake2b(_body, digest_size=16).hexdigest()
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp(prefix='sticky_pi_test_')
+        self._target = os.path.join(self._tmp_dir, '0a5bb6f4.2020-06-20_20-19-15.jpg')
+        with open(self._target, 'wb') as f:
+            f.write(self._body)
+        stat = os.stat(self._target)
+        self._stat = [stat.st_size, stat.st_mtime_ns]
+        self._series = ImageSeries(device='0a5bb6f4',
+                                   start_datetime='2020-01-01_00-00-00',
+                                   end_datetime='2021-01-01_00-00-00')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _cached_hash(self, remote_md5, manifest_entry):
+        return self._series._cached_content_hash(self._target, remote_md5, manifest_entry)
+
+    def test_manifest_hit(self):
+        # same size and mtime: the recorded hashes are trusted, the file is not read
+        entry = self._stat + [self._md5, 'recorded-hash']
+        self.assertEqual(self._cached_hash(self._md5, entry), 'recorded-hash')
+        # unless the remote image changed
+        self.assertIsNone(self._cached_hash('0' * 32, entry))
+
+    def test_stat_mismatch(self):
+        # e.g. the file was touched: we compare the content hash
+        stale_stat = [self._stat[0], self._stat[1] - 1]
+        self.assertEqual(self._cached_hash(self._md5, stale_stat + [self._md5, self._hash]), self._hash)
+        self.assertIsNone(self._cached_hash(self._md5, stale_stat + [self._md5, '0' * 32]))
+
+    def test_recorded_md5_differs(self):
+        # the recorded content hash is of another version of the image: only the md5 can tell
+        stale_stat = [self._stat[0], self._stat[1] - 1]
+        self.assertEqual(self._cached_hash(self._md5, stale_stat + ['0' * 32, '0' * 32]), self._hash)
+        self.assertIsNone(self._cached_hash('1' * 32, stale_stat + ['0' * 32, self._hash]))
+
+    def test_malformed_entry(self):
+        # missing, malformed, or older ([size, mtime_ns, md5]) entries are manifest misses
+        for entry in [None, 5, 'abc', [], self._stat + [self._md5]]:
+            self.assertEqual(self._cached_hash(self._md5, entry), self._hash)
+            self.assertIsNone(self._cached_hash('0' * 32, entry))
+
+    def test_missing_file(self):
+        os.remove(self._target)
+        self.assertIsNone(self._cached_hash(self._md5, self._stat + [self._md5, self._hash]))
+
+    def test_save_merges(self):
+        # another series synced in the same directory meanwhile
+        self._series._save_manifest(self._tmp_dir, {'a.jpg': [1, 2, 'md5-a', 'hash-a'],
+                                                     'b.jpg': [3, 4, 'md5-b', 'hash-b']})
+        self._series._save_manifest(self._tmp_dir, {'b.jpg': [5, 6, 'md5-b2', 'hash-b2'],
+                                                     'c.jpg': [7, 8, 'md5-c', 'hash-c']})
+        self.assertEqual(self._series._load_manifest(self._tmp_dir),
+                         {'a.jpg': [1, 2, 'md5-a', 'hash-a'],
+                          'b.jpg': [5, 6, 'md5-b2', 'hash-b2'],
+                          'c.jpg': [7, 8, 'md5-c', 'hash-c']})
+        # no temporary file left behind
+        self.assertEqual(sorted(os.listdir(self._tmp_dir)),
+                         ['.manifest.json', '0a5bb6f4.2020-06-20_20-19-15.jpg'])
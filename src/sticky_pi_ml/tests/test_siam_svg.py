@@ -26,6 +26,22 @@ class TestSiamSVG(unittest.TestCase):
 
         self.assertEqual(svg_img.device, '0a5bb6f4')
 
+    def test_extract_jpeg(self):
+        svg_img = SiamSVG(self._test_image)
+        # served from the decoded bytes, in the same (top, bottom) order as the two images
+        for id, im in enumerate([svg_img._im0, svg_img._im1]):
+            jpeg = svg_img.extract_jpeg(as_buffer=True, id=id).read()
+            self.assertEqual(jpeg[:2], b'\xff\xd8')
+            self.assertEqual(jpeg, im._buffer.getvalue())
+        temp_dir = tempfile.mkdtemp(prefix='sticky_pi_')
+        try:
+            target = os.path.join(temp_dir, 'bottom.jpg')
+            svg_img.extract_jpeg(target, id=1)
+            with open(target, 'rb') as f:
+                self.assertEqual(f.read(), svg_img.extract_jpeg(as_buffer=True, id=1).read())
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_file_ops(self):
         temp_dir = tempfile.mkdtemp(prefix='sticky_pi_')
         try:
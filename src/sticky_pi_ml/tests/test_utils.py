@@ -0,0 +1,115 @@
+import unittest
+import os
+import io
+import glob
+import cv2
+import numpy as np
+import struct
+import PIL.Image
+from sticky_pi_ml.utils import decode_jpeg, jpeg_orientation, jpeg_shape
+
+test_dir = os.path.dirname(__file__)
+_test_image = os.path.join(test_dir, "raw_images/1b74105a/1b74105a.2020-07-05_10-07-16.jpg")
+
+
+def rotated_jpeg_bytes(orientation, path=_test_image, **save_kwargs):
+    # the test image, re-encoded with the given EXIF orientation tag
+    with PIL.Image.open(path) as img:
+        exif = img.getexif()
+        exif[0x0112] = orientation
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', exif=exif, **save_kwargs)
+    return buffer.getvalue()
+
+
+def _segment(marker, payload):
+    # a JPEG marker segment: the length field counts itself but not the marker
+    return b'\xff' + bytes([marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _sof(marker, height, width):
+    # precision, height, width, then one component (id, sampling, quantisation table)
+    return _segment(marker, struct.pack('>BHHB', 8, height, width, 1) + b'\x01\x11\x00')
+
+
+class TestDecodeJpeg(unittest.TestCase):
+    def test_decode(self):
+        with open(_test_image, 'rb') as f:
+            array = decode_jpeg(f.read())
+        self.assertEqual(array.shape, (1944, 2592, 3))
+        self.assertEqual(array.dtype, np.uint8)
+
+    def test_orientation_applied(self):
+        # whichever decoder is installed, rotated jpegs come out as OpenCV would decode them
+        for orientation in [1, 3, 6, 8]:
+            buffer = rotated_jpeg_bytes(orientation)
+            self.assertEqual(jpeg_orientation(buffer), orientation)
+            expected = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+            array = decode_jpeg(buffer)
+            self.assertEqual(array.shape, expected.shape)
+            if orientation != 1:
+                np.testing.assert_array_equal(array, expected)
+
+    def test_corrupt(self):
+        self.assertIsNone(decode_jpeg(b'\xff\xd8\xff\xe0 not a jpeg'))
+        self.assertIsNone(decode_jpeg(b'not an image at all'))
+
+
+class TestJpegShape(unittest.TestCase):
+    _soi = b'\xff\xd8'
+    _sos = _segment(0xDA, b'\x01\x01\x00\x00\x3f\x00') + b'\x00' * 16 + b'\xff\xd9'
+
+    def test_decoded_shape(self):
+        # the header gives the shape of the decoded array, for all test images
+        paths = sorted(glob.glob(os.path.join(test_dir, 'raw_images', '**', '*.jpg'), recursive=True))
+        self.assertGreater(len(paths), 0)
+        for p in paths:
+            with open(p, 'rb') as f:
+                buffer = f.read()
+            self.assertEqual(jpeg_shape(buffer), decode_jpeg(buffer).shape)
+
+    def test_rotated(self):
+        for orientation in [1, 3, 6, 8]:
+            buffer = rotated_jpeg_bytes(orientation)
+            self.assertEqual(jpeg_shape(buffer), decode_jpeg(buffer).shape)
+
+    def test_progressive(self):
+        # SOF2 rather than SOF0
+        buffer = rotated_jpeg_bytes(1, progressive=True)
+        self.assertIn(b'\xff\xc2', buffer)
+        self.assertEqual(jpeg_shape(buffer), (1944, 2592, 3))
+        self.assertEqual(jpeg_shape(self._soi + _sof(0xC2, 100, 200) + self._sos), (100, 200, 3))
+
+    def test_thumbnail(self):
+        # an EXIF thumbnail, with its own SOF, comes before the frame of the actual image
+        thumbnail = self._soi + _sof(0xC0, 8, 16) + self._sos
+        app1 = _segment(0xE1, b'Exif\x00\x00' + b'II*\x00\x08\x00\x00\x00\x00\x00' + thumbnail)
+        buffer = self._soi + app1 + _sof(0xC0, 100, 200) + self._sos
+        self.assertEqual(jpeg_shape(buffer), (100, 200, 3))
+
+    def test_fill_bytes(self):
+        # any number of 0xFF may precede a marker
+        buffer = self._soi + b'\xff\xff\xff' + _segment(0xE0, b'JFIF\x00' + b'\x00' * 9) + \
+                 b'\xff\xff' + _sof(0xC0, 100, 200) + self._sos
+        self.assertEqual(jpeg_shape(buffer), (100, 200, 3))
+
+    def test_truncated(self):
+        buffer = self._soi + _segment(0xE0, b'JFIF\x00' + b'\x00' * 9) + _sof(0xC0, 100, 200) + self._sos
+        sof_offset = buffer.index(b'\xff\xc0')
+        # cut in the middle of the frame header, and before it
+        for end in [sof_offset + 6, sof_offset + 2, sof_offset, 10, 3]:
+            self.assertIsNone(jpeg_shape(buffer[:end]))
+        with open(_test_image, 'rb') as f:
+            self.assertIsNone(jpeg_shape(f.read(100)))
+
+    def test_no_frame(self):
+        # start of scan (or end of image) before any frame header
+        self.assertIsNone(jpeg_shape(self._soi + self._sos))
+        self.assertIsNone(jpeg_shape(self._soi + b'\xff\xd9'))
+
+    def test_not_jpeg(self):
+        self.assertIsNone(jpeg_shape(b''))
+        self.assertIsNone(jpeg_shape(b'not an image at all'))
+        png = io.BytesIO()
+        PIL.Image.new('RGB', (20, 10)).save(png, 'PNG')
+        self.assertIsNone(jpeg_shape(png.getvalue()))
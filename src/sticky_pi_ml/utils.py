@@ -1,4 +1,3 @@
-import pandas as pd
 import os
 import dotenv
 import argparse
@@ -10,22 +9,165 @@ import logging
 import cv2
 from typing import List, Tuple, Union, IO
 import datetime
+import sys
+import struct
+
+try:
+    # libjpeg-turbo's SIMD decoder is markedly faster than the libjpeg most OpenCV builds ship with
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _TURBO_JPEG = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG (or the libturbojpeg shared library) is not available: decode with OpenCV
+    _TURBO_JPEG = None
 
 STRING_DATETIME_FORMAT = '%Y-%m-%d_%H-%M-%S'
+# JPEG start of frame markers: 0xC0-0xCF, except DHT (0xC4), JPG (0xC8) and DAC (0xCC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# EXIF orientations that rotate by 90 degrees (possibly mirrored), i.e. decoded width and height are swapped
+EXIF_TRANSPOSED_ORIENTATIONS = frozenset({5, 6, 7, 8})
+# large reads keep both the disk and the hash busy (the old 32KiB buffer left both mostly idle)
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def md5_hasher():
+    # md5 is only used as a content fingerprint, not for security
+    if sys.version_info >= (3, 9):
+        return hashlib.md5(usedforsecurity=False)
+    return hashlib.md5()
+
 
+def content_hasher():
+    return hashlib.blake2b(digest_size=16)
 
-def md5(file: Union[IO, str], chunksize=32768):
+
+def _hash_file(file: Union[IO, str], hasher, chunksize: int):
     # if the file is a path, open and recurse
     if type(file) == str:
         with open(file, 'rb') as f:
-            return md5(f)
+            return _hash_file(f, hasher, chunksize)
     try:
-        hash_md5 = hashlib.md5()
-        for chunk in iter(lambda: file.read(chunksize), b""):
-            hash_md5.update(chunk)
+        while chunk := file.read(chunksize):
+            hasher.update(chunk)
     finally:
         file.seek(0)
-    return hash_md5.hexdigest()
+    return hasher.hexdigest()
+
+
+def md5(file: Union[IO, str], chunksize=HASH_CHUNK_SIZE):
+    # md5 is the fingerprint format the API expects (e.g. image metadata, remote `md5` fields)
+    return _hash_file(file, md5_hasher(), chunksize)
+
+
+def content_hash(file: Union[IO, str], chunksize=HASH_CHUNK_SIZE):
+    """
+    A fast (blake2b, 128 bits) content fingerprint, for comparisons that never leave this machine.
+    Use :func:`md5` whenever the hash has to match one computed by the API.
+
+    :param file: a path or a binary file-like object
+    :param chunksize: the number of bytes read at once
+    :return: the hex digest
+    """
+    return _hash_file(file, content_hasher(), chunksize)
+
+
+def decode_jpeg(buffer: bytes) -> np.ndarray:
+    """
+    Decode an encoded image (as read from a file) to a BGR array, like ``cv2.imdecode(..., cv2.IMREAD_COLOR)``.
+    JPEGs go through libjpeg-turbo when PyTurboJPEG is installed, anything else through OpenCV.
+    libjpeg-turbo does not apply EXIF orientation, so rotated JPEGs (and any JPEG it fails on)
+    are left to OpenCV: the result does not depend on whether PyTurboJPEG is installed.
+
+    :param buffer: the encoded bytes
+    :return: a (h, w, 3) uint8 array, or ``None`` if the buffer cannot be decoded
+    """
+    if _TURBO_JPEG is not None and buffer[:2] == b'\xff\xd8' and jpeg_orientation(buffer) == 1:
+        try:
+            return _TURBO_JPEG.decode(buffer, pixel_format=TJPF_BGR)
+        except OSError as e:
+            logging.debug('libjpeg-turbo could not decode buffer (%s), trying OpenCV' % e)
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _exif_orientation(tiff: bytes) -> int:
+    # the Orientation tag (0x0112) of IFD0, in the TIFF structure of an Exif APP1 segment
+    try:
+        endian = {b'II': '<', b'MM': '>'}[tiff[:2]]
+        ifd_offset, = struct.unpack(endian + 'I', tiff[4:8])
+        n_entries, = struct.unpack(endian + 'H', tiff[ifd_offset: ifd_offset + 2])
+        for i in range(n_entries):
+            entry = ifd_offset + 2 + 12 * i
+            tag, = struct.unpack(endian + 'H', tiff[entry: entry + 2])
+            if tag == 0x0112:
+                # a single SHORT, left-justified in the value field
+                orientation, = struct.unpack(endian + 'H', tiff[entry + 8: entry + 10])
+                return orientation
+    except (KeyError, struct.error):
+        pass
+    return 1
+
+
+def _jpeg_header(buffer: bytes) -> Tuple[int, Union[Tuple[int, int], None]]:
+    # walks the JPEG segments up to the start of frame.
+    # Returns the EXIF orientation (1 by default) and the stored (height, width), or None if not found
+    orientation = 1
+    if buffer[:2] != b'\xff\xd8':
+        return orientation, None
+    offset = 2
+    while offset + 4 <= len(buffer):
+        if buffer[offset] != 0xFF:
+            return orientation, None
+        marker = buffer[offset + 1]
+        if marker == 0xFF:
+            # fill byte
+            offset += 1
+            continue
+        if marker in (0xD9, 0xDA):
+            # end of image or start of scan before any frame header
+            return orientation, None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # standalone markers, without a length field
+            offset += 2
+            continue
+
+        segment_length, = struct.unpack('>H', buffer[offset + 2: offset + 4])
+        segment = buffer[offset + 4: offset + 2 + segment_length]
+        if marker in _JPEG_SOF_MARKERS:
+            # precision (1), height (2), width (2)
+            if len(segment) < 5:
+                return orientation, None
+            height, width = struct.unpack('>HH', segment[1:5])
+            return orientation, (height, width)
+        if marker == 0xE1 and segment[:6] == b'Exif\x00\x00':
+            orientation = _exif_orientation(segment[6:])
+        offset += 2 + segment_length
+    return orientation, None
+
+
+def jpeg_orientation(buffer: bytes) -> int:
+    """
+    :param buffer: the encoded bytes of a JPEG
+    :return: the EXIF orientation (1 to 8), 1 if there is none
+    """
+    return _jpeg_header(buffer)[0]
+
+
+def jpeg_shape(buffer: bytes) -> Union[Tuple[int, int, int], None]:
+    """
+    Read the dimensions of a JPEG from its start of frame segment, without decoding any pixel.
+    Segments are walked one by one (rather than searching for the first SOF marker),
+    so the frame of an embedded EXIF thumbnail is never picked.
+    Like the decoded array, the shape accounts for the EXIF orientation (5 to 8 swap height and width).
+
+    :param buffer: the encoded bytes
+    :return: ``(height, width, 3)``, or ``None`` if the buffer is not a JPEG or has no frame header
+    """
+    orientation, size = _jpeg_header(buffer)
+    if size is None:
+        return None
+    height, width = size
+    if orientation in EXIF_TRANSPOSED_ORIENTATIONS:
+        height, width = width, height
+    return height, width, 3
 
 
 def iou_match_pairs(arr: np.ndarray, iou_threshold: float) -> List[Tuple[int, int]]:
@@ -166,6 +308,7 @@ def string_to_datetime(string):
 
 
 def datetime_to_string(dt):
+    import pandas as pd
     if pd.isnull(dt):
         return None
     return datetime.datetime.strftime(dt, STRING_DATETIME_FORMAT)